@@ -1,13 +1,22 @@
-import os, json, logging, re
+import os, logging, re, difflib, heapq, time, gzip, asyncio, hashlib, threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from functools import lru_cache
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, Optional, Tuple, List
+from typing import Any, Dict, Optional, Tuple, List, TYPE_CHECKING
 
 import azure.functions as func
-import requests
+import orjson
 
-from jinja2 import Environment, BaseLoader, select_autoescape
-from azure.storage.blob import BlobServiceClient
-from azure.storage.blob._shared.base_client import parse_connection_str
+from azure.storage.blob import BlobServiceClient, BlobSasPermissions, generate_blob_sas
+
+# Downstream calls, the CV template and the SAS cache, shared with cvagent / renderpdf_html
+from shared_code.downstream import (
+    PPTXEXTRACT_PATH, CVNORMALIZE_PATH, RENDER_PATH, PPTXEXTRACT_KEY, CVNORMALIZE_KEY, RENDER_KEY,
+    HTTP_TIMEOUT_SEC, build_url as _build_url, post_json as _post_json, normalize_cv as _normalize_cv,
+)
+from shared_code.cvhtml import html_from_cv as _html_from_cv
+from shared_code.sas import SasUrlCache
 
 # ========== ENV HELPERS (match your normalize style) ==========
 def _get(name, *aliases, default=None):
@@ -17,33 +26,39 @@ def _get(name, *aliases, default=None):
     return default
 
 # ----- AOAI (Azure OpenAI) -----
-from openai import AzureOpenAI
+# The SDK is imported on first use in client(): it is a large tree and cold starts that
+# return early (bad JSON, missing prompt) never need it.
+if TYPE_CHECKING:
+    from openai import AzureOpenAI
 AOAI_ENDPOINT    = _get("AOAI_ENDPOINT", "AZURE_OPENAI_ENDPOINT")
 AOAI_KEY         = _get("AOAI_KEY", "AZURE_OPENAI_API_KEY")
 AOAI_DEPLOYMENT  = _get("AOAI_DEPLOYMENT", "AZURE_OPENAI_DEPLOYMENT", default="gpt-4.1")
 AOAI_API_VERSION = _get("AOAI_API_VERSION", "AZURE_OPENAI_API_VERSION", default="2024-10-21")
 
-_client: Optional[AzureOpenAI] = None
-def client() -> AzureOpenAI:
+_client: Optional["AzureOpenAI"] = None
+def client() -> "AzureOpenAI":
     global _client
     if _client is None:
         if not (AOAI_ENDPOINT and AOAI_KEY):
             raise RuntimeError("AOAI not configured (set AOAI_ENDPOINT and AOAI_KEY)")
+        from openai import AzureOpenAI
         _client = AzureOpenAI(azure_endpoint=AOAI_ENDPOINT, api_key=AOAI_KEY, api_version=AOAI_API_VERSION)
     return _client
 
-# ----- Downstream (reuse your working envs) -----
-BASE_URL          = (_get("DOWNSTREAM_BASE_URL", "FUNCS_BASE_URL", default="") or "").rstrip("/")
-PPTXEXTRACT_PATH  = _get("PPTXEXTRACT_PATH", default="/api/pptxextract")
-CVNORMALIZE_PATH  = _get("CVNORMALIZE_PATH", default="/api/cvnormalize")
-RENDER_PATH       = _get("RENDER_PATH", default="/api/renderpdf_html")
-PPTXEXTRACT_KEY   = _get("PPTXEXTRACT_KEY", default="")
-CVNORMALIZE_KEY   = _get("CVNORMALIZE_KEY", default="")
-RENDER_KEY        = _get("RENDER_KEY", default="")
-
-HTTP_TIMEOUT_SEC   = int(_get("HTTP_TIMEOUT_SEC", default="180"))
+# ----- Pipeline -----
 INCOMING_CONTAINER = _get("INCOMING_CONTAINER", default="incoming")
+INCOMING_PREFIX    = _get("INCOMING_PREFIX", default=None)  # optional virtual folder, filtered server-side
 SAS_MINUTES        = int(_get("SAS_MINUTES", default="120"))
+RENDER_GZIP        = _get("RENDER_GZIP", default="1") not in ("0", "false", "False")
+BATCH_CONCURRENCY  = int(_get("CHATCV_BATCH_CONCURRENCY", default="8"))  # pipelines in flight per batch
+MAX_BATCH          = int(_get("CHATCV_MAX_BATCH", default="20"))  # longer prompt lists are rejected with 400
+# One AOAI call for intent + blob pick (waits for the listing first); off keeps intent ∥ listing
+COMBINED_PICK      = _get("AOAI_COMBINED_PICK", default="0") in ("1", "true", "True")
+BLOB_LIST_TTL_SEC  = float(_get("BLOB_LIST_TTL_SEC", default="30"))  # 0 disables the listing cache
+
+# Local filename match is trusted (LLM pick skipped) at/above this score with a clear lead
+LOCAL_PICK_THRESHOLD = float(_get("LOCAL_PICK_THRESHOLD", default="0.7"))
+LOCAL_PICK_MARGIN    = float(_get("LOCAL_PICK_MARGIN", default="0.15"))
 
 # ========== STORAGE ==========
 CONN_STR = os.environ.get("AzureWebJobsStorage")
@@ -51,15 +66,13 @@ if not CONN_STR:
     raise RuntimeError("AzureWebJobsStorage not set")
 
 _bsc = BlobServiceClient.from_connection_string(CONN_STR)
+_INCOMING_CC = _bsc.get_container_client(INCOMING_CONTAINER)  # reused by every listing / exists check
+
+# Parse connection string and capture SAS if present (values may contain '=', e.g. base64 keys/SAS)
+_CS_RE = re.compile(r"([^;=]+)=([^;]*)")
 
-# Parse connection string and capture SAS if present
 def _kv_from_conn_str(cs: str) -> dict:
-    out = {}
-    for part in cs.split(";"):
-        if "=" in part:
-            k, v = part.split("=", 1)
-            out[k.strip()] = v.strip()
-    return out
+    return {m.group(1).strip(): m.group(2).strip() for m in _CS_RE.finditer(cs)}
 
 cs_kv = _kv_from_conn_str(CONN_STR)
 
@@ -68,19 +81,20 @@ ACCOUNT_KEY  = None
 CONN_SAS     = (cs_kv.get("SharedAccessSignature") or cs_kv.get("SharedAccessSig") or "").lstrip("?")
 ACCOUNT_URL  = cs_kv.get("BlobEndpoint") or _bsc.url.rstrip("/")
 
-try:
-    parsed = parse_connection_str(CONN_STR)
-    # parse_connection_str returns a dict-like with account parts when AccountKey is present
-    ACCOUNT_NAME = parsed.get("account_name")
-    ACCOUNT_KEY  = parsed.get("account_key")
-except Exception as e:
-    logging.warning(f"[chatcv] parse_connection_str failed (likely SAS-only connection string): {e}")
-
-# Explicit override wins (Linux env is case-sensitive)
+# Explicit override wins (Linux env is case-sensitive); only parse the connection string without it
 env_name = os.environ.get("STORAGE_ACCOUNT_NAME")
 env_key  = os.environ.get("STORAGE_ACCOUNT_KEY")
 if env_name and env_key:
     ACCOUNT_NAME, ACCOUNT_KEY = env_name, env_key
+else:
+    try:
+        from azure.storage.blob._shared.base_client import parse_connection_str
+        parsed = parse_connection_str(CONN_STR)
+        # parse_connection_str returns a dict-like with account parts when AccountKey is present
+        ACCOUNT_NAME = parsed.get("account_name")
+        ACCOUNT_KEY  = parsed.get("account_key")
+    except Exception as e:
+        logging.warning(f"[chatcv] parse_connection_str failed (likely SAS-only connection string): {e}")
 
 if ACCOUNT_KEY:
     logging.info("[chatcv] Storage auth: using AccountKey (can mint SAS).")
@@ -89,166 +103,72 @@ elif CONN_SAS:
 else:
     logging.error("[chatcv] No AccountKey or SAS available; blob SAS URL generation will fail.")
 
-# ========== HTTP/PIPELINE HELPERS ==========
-def _build_url(req: func.HttpRequest, path: str, key: str = "") -> str:
-    if path.startswith("http"):
-        url = path
-    elif BASE_URL:
-        url = f"{BASE_URL}{path}"
-    else:
-        root = req.url.split("/api/")[0]
-        url = f"{root}{path}"
-    if key:
-        url += ("&" if "?" in url else "?") + "code=" + key
-    return url
-
-def _post_json(url: str, payload: dict, timeout: int = HTTP_TIMEOUT_SEC):
-    try:
-        r = requests.post(url, json=payload, timeout=timeout)
-        raw = r.text
-        try:
-            j = r.json()
-        except Exception:
-            j = None
-        return r.status_code, j, raw
-    except Exception as e:
-        return 0, None, f"Network error calling {url}: {e}"
+# ========== SAS ==========
+_SAS_CACHE     = SasUrlCache()
+_SAS_READ_PERM = BlobSasPermissions(read=True)
+_SAS_DELTA     = timedelta(minutes=SAS_MINUTES)
 
 def _blob_sas_url(container: str, blob_name: str, minutes: int = SAS_MINUTES) -> str:
     """
     Return a signed URL for the blob.
-    - If we have an AccountKey, mint a fresh short-lived SAS.
+    - If we have an AccountKey, mint a fresh short-lived SAS (cached per blob).
     - Otherwise, if the connection string already contains a SAS, reuse it.
+    Signing is local; existence is only checked (_blob_exists) after the extractor fails.
     """
-    bc = _bsc.get_blob_client(container, blob_name)
-    if not bc.exists():
-        raise FileNotFoundError(f"Blob not found: {blob_name}")
+    hit = _SAS_CACHE.get(container, blob_name, minutes)
+    if hit:
+        return hit
 
     base_url = f"{ACCOUNT_URL}/{container}/{blob_name}"
 
     if ACCOUNT_KEY:
-        from azure.storage.blob import generate_blob_sas, BlobSasPermissions
+        expiry = datetime.now(timezone.utc) + (_SAS_DELTA if minutes == SAS_MINUTES else timedelta(minutes=minutes))
         sas = generate_blob_sas(
             account_name=ACCOUNT_NAME,
             container_name=container,
             blob_name=blob_name,
             account_key=ACCOUNT_KEY,
-            permission=BlobSasPermissions(read=True),
-            expiry=datetime.now(timezone.utc) + timedelta(minutes=minutes),
+            permission=_SAS_READ_PERM,
+            expiry=expiry,
         )
-        return f"{base_url}?{sas}"
+        url = f"{base_url}?{sas}"
+        _SAS_CACHE.put(container, blob_name, url, expiry)
+        return url
 
     if CONN_SAS:
         return f"{base_url}?{CONN_SAS}"
 
     raise RuntimeError("No AccountKey or SharedAccessSignature available to build SAS")
 
-def list_recent_cv_blobs(limit:int=60):
-    cc = _bsc.get_container_client(INCOMING_CONTAINER)
-    blobs = list(cc.list_blobs())
-    blobs = [b for b in blobs if str(b.name).lower().endswith((".pptx",".pptm",".ppsx",".ppt",".odp",".potx",".potm"))]
-    blobs.sort(key=lambda b: b.last_modified or datetime(2000,1,1,tzinfo=timezone.utc), reverse=True)
-    return blobs[:limit]
-
-# ========== TEMPLATES (same as your exporter) ==========
-_EUROPASS_HTML = """<!doctype html>
-<html><head><meta charset="utf-8"/>
-<title>{{ person.full_name or 'Curriculum Vitae' }}</title>
-<style>
-  @page { size: A4; margin: 10mm }
-  body{margin:0;font-family:"DejaVu Sans",Arial,Helvetica,sans-serif;font-size:12px;color:#0f172a}
-  .eu-root{display:grid;grid-template-columns:320px 1fr;min-height:100vh}
-  .eu-side{background:#f8fafc;border-right:1px solid #e5e7eb;padding:22px}
-  .eu-main{padding:22px 26px}
-  .eu-name{font-size:26px;font-weight:800;margin:0}
-  .eu-title{font-size:13px;color:#475569;margin-top:4px}
-  .eu-kv{display:grid;grid-template-columns:22px 1fr;gap:10px;margin:6px 0}
-  .ico{width:22px;height:22px;border-radius:6px;background:#e2e8f0;display:flex;align-items:center;justify-content:center;font-size:12px}
-  .eu-sec{margin-top:16px}
-  .eu-sec h2{font-size:14px;font-weight:800;margin:0 0 10px;text-transform:uppercase;letter-spacing:.06em}
-  .eu-chip{display:inline-block;background:#eef2ff;color:#3730a3;border:1px solid #e0e7ff;border-radius:999px;padding:3px 10px;margin:3px 6px 0 0;font-size:11px}
-  .eu-job{margin:12px 0 10px}
-  .line2{color:#64748b;font-size:12px;margin-top:2px}
-  .desc{margin-top:6px}
-  .eu-job ul{margin:6px 0 0 18px}
-  .hr{height:1px;background:linear-gradient(90deg,#e5e7eb 60%,transparent 0) repeat-x;background-size:8px 1px;margin:14px 0}
-</style></head>
-<body>
-<div class="eu-root">
-  <aside class="eu-side">
-    <h1 class="eu-name">{{ person.full_name or '' }}</h1>
-    {% if person.title %}<div class="eu-title">{{ person.title }}</div>{% endif %}
-    <div>
-      {% for c in contacts %}
-        <div class="eu-kv"><div class="ico">{{ c.ico }}</div><div>{{ c.txt }}</div></div>
-      {% endfor %}
-    </div>
-    {% if skills %}
-    <div class="eu-sec"><h2>Skills</h2><div>{% for s in skills %}<span class="eu-chip">{{ s }}</span>{% endfor %}</div></div>
-    {% endif %}
-    {% if languages %}
-    <div class="eu-sec"><h2>Languages</h2><div>{% for l in languages %}<span class="eu-chip">{{ l.name }}{% if l.level %} — {{ l.level }}{% endif %}</span>{% endfor %}</div></div>
-    {% endif %}
-  </aside>
-  <main class="eu-main">
-    {% if summary %}
-      <section class="eu-sec"><h2>About Me</h2><div>{{ summary }}</div></section><div class="hr"></div>
-    {% endif %}
-    {% if experiences %}
-      <section class="eu-sec"><h2>Work Experience</h2>
-        {% for e in experiences %}
-          <div class="eu-job">
-            <div class="line1"><strong>{{ e.title }}</strong> — {{ e.company }}</div>
-            <div class="line2">{{ e.start_date }}{% if e.end_date %} – {{ e.end_date }}{% else %} – Present{% endif %}{% if e.location %} • {{ e.location }}{% endif %}</div>
-            {% if e.description %}<div class="desc">{{ e.description }}</div>{% endif %}
-            {% if e.bullets %}<ul>{% for b in e.bullets %}<li>{{ b }}</li>{% endfor %}</ul>{% endif %}
-          </div>
-        {% endfor %}
-      </section>
-    {% endif %}
-    {% if education %}
-      <section class="eu-sec"><h2>Education & Training</h2>
-        {% for ed in education %}
-          <div class="eu-edu">
-            <div class="line1"><strong>{{ ed.degree or ed.title }}</strong> — {{ ed.institution }}</div>
-            <div class="line2">{{ ed.start_date }}{% if ed.end_date %} – {{ ed.end_date }}{% endif %}{% if ed.location %} • {{ ed.location }}{% endif %}</div>
-            {% if ed.details %}<div class="desc">{{ ed.details }}</div>{% endif %}
-          </div>
-        {% endfor %}
-      </section>
-    {% endif %}
-  </main>
-</div>
-</body></html>
-"""
-
-# Kyndryl variant: red sidebar; main stays black on white
-_KYNDRYL_HTML = _EUROPASS_HTML \
-    .replace('#f8fafc', '#F9423A') \
-    .replace('border-right:1px solid #e5e7eb', 'border-right:1px solid #a60f24')
-
-def _html_from_cv(cv: dict, template_name: str = "europass") -> str:
-    env = Environment(loader=BaseLoader(), autoescape=select_autoescape(["html"]))
-    j = env.from_string(_KYNDRYL_HTML if (template_name or "europass").lower() == "kyndryl" else _EUROPASS_HTML)
-    pi = (cv.get("personal_info") or cv.get("personal") or {}) if isinstance(cv, dict) else {}
-    contacts = []
-    def add(icon, val):
-        if val: contacts.append({"ico": icon, "txt": val})
-    add("@",  pi.get("email")); add("☎", pi.get("phone")); add("in", pi.get("linkedin")); add("🌐", pi.get("website"))
-    addr = ", ".join([pi.get("address") or "", pi.get("city") or "", pi.get("country") or ""]).strip(", ")
-    add("📍", addr); add("🎂", pi.get("date_of_birth")); add("⚧", pi.get("gender")); add("🌎", pi.get("nationality"))
-    skills = [s for g in (cv.get("skills_groups") or []) for s in (g.get("items") or [])]
-    model = {
-        "person": {"full_name": pi.get("full_name") or cv.get("name"),
-                   "title":     pi.get("headline")  or cv.get("title")},
-        "contacts": contacts,
-        "skills": skills,
-        "languages": cv.get("languages") or [],
-        "summary": cv.get("summary") or pi.get("summary"),
-        "experiences": cv.get("work_experience") or cv.get("experience") or [],
-        "education": cv.get("education") or [],
-    }
-    return j.render(**model)
+def _blob_exists(container: str, blob_name: str) -> bool:
+    cc = _INCOMING_CC if container == INCOMING_CONTAINER else _bsc.get_container_client(container)
+    try:
+        if cc.get_blob_client(blob_name).exists():
+            return True
+    except Exception:
+        return True  # can't tell; keep the caller's original error
+    _SAS_CACHE.discard(container, blob_name)
+    return False
+
+_PPT_EXTS = frozenset((".pptx",".pptm",".ppsx",".ppt",".odp",".potx",".potm"))
+_EPOCH_FALLBACK = datetime(2000,1,1,tzinfo=timezone.utc)  # sort key for blobs without last_modified
+_BLOB_CACHE: Dict[str, Any] = {"t": 0.0, "limit": 0, "v": []}
+
+def list_recent_cv_blobs(limit:int=60, refresh:bool=False):
+    now = time.monotonic()
+    if (not refresh and BLOB_LIST_TTL_SEC > 0 and _BLOB_CACHE["v"] and _BLOB_CACHE["limit"] >= limit
+            and now - _BLOB_CACHE["t"] < BLOB_LIST_TTL_SEC):
+        return _BLOB_CACHE["v"][:limit]
+    blobs = _list_recent_cv_blobs_uncached(limit)
+    if BLOB_LIST_TTL_SEC > 0:
+        _BLOB_CACHE.update(t=now, limit=limit, v=blobs)
+    return blobs
+
+def _list_recent_cv_blobs_uncached(limit: int):
+    # Stream pages and keep only the newest `limit` decks instead of materializing + sorting the container
+    pages = _INCOMING_CC.list_blobs(name_starts_with=INCOMING_PREFIX, results_per_page=min(limit * 4, 500))
+    it = (b for b in pages if os.path.splitext(b.name)[1].lower() in _PPT_EXTS)
+    return heapq.nlargest(limit, it, key=lambda b: b.last_modified or _EPOCH_FALLBACK)
 
 # ========== GPT 4.1 JSON Schemas (AOAI chat.completions) ==========
 INTENT_SCHEMA: Dict[str, Any] = {
@@ -264,6 +184,16 @@ BLOB_PICK_SCHEMA: Dict[str, Any] = {
     "properties":{"best":{"type":"string"}},
     "required":["best"]
 }
+INTENT_PICK_SCHEMA: Dict[str, Any] = {
+    "type":"object","additionalProperties":False,
+    "properties":{**INTENT_SCHEMA["properties"], **BLOB_PICK_SCHEMA["properties"]},
+    "required":["person_name","best"]
+}
+
+# response_format payloads are static; build them once
+_INTENT_RF: Dict[str, Any] = {"type":"json_schema","json_schema":{"name":"Intent","schema":INTENT_SCHEMA}}
+_BLOB_PICK_RF: Dict[str, Any] = {"type":"json_schema","json_schema":{"name":"BlobPick","schema":BLOB_PICK_SCHEMA}}
+_INTENT_PICK_RF: Dict[str, Any] = {"type":"json_schema","json_schema":{"name":"IntentPick","schema":INTENT_PICK_SCHEMA}}
 
 SYSTEM_INTENT = (
     "Extract the person_name and the template from the user's request. "
@@ -277,18 +207,51 @@ SYSTEM_BLOB_PICK = (
     "Return ONLY JSON with the filename in the 'best' field. If nothing matches, return 'NONE'."
 )
 
+SYSTEM_INTENT_PICK = (
+    "Extract the person_name and the template from the user's request "
+    "(allowed templates: europass, kyndryl; default europass), then select the single best CV filename "
+    "for that person from the candidates. Put the filename in 'best', or 'NONE' if nothing matches. "
+    "Return ONLY JSON."
+)
+
+# Static system turns, shared by every call (treated as read-only)
+_INTENT_MSG_SYS: Dict[str, str] = {"role":"system","content":SYSTEM_INTENT}
+_BLOB_MSG_SYS: Dict[str, str]   = {"role":"system","content":SYSTEM_BLOB_PICK}
+_INTENT_PICK_MSG_SYS: Dict[str, str] = {"role":"system","content":SYSTEM_INTENT_PICK}
+
+# digest(casefolded, whitespace-collapsed prompt) -> (person, template); LRU-bounded like _SAS_CACHE.
+# Hashing keeps long prompts out of memory and lets "Give CV of ada" reuse "give cv of Ada".
+_INTENT_CACHE: "OrderedDict[bytes, Tuple[str, str]]" = OrderedDict()
+_INTENT_CACHE_MAX = 512
+_INTENT_LOCK = threading.Lock()
+
 def parse_intent_with_llm(prompt: str) -> Tuple[str,str]:
     """Returns (person_name, template|europass). Uses AOAI chat.completions with JSON schema."""
+    prompt = " ".join(prompt.split())
+    key = hashlib.blake2b(prompt.casefold().encode("utf-8"), digest_size=16).digest()
+    with _INTENT_LOCK:
+        hit = _INTENT_CACHE.get(key)
+        if hit:
+            _INTENT_CACHE.move_to_end(key)
+            return hit
+    result = _parse_intent_uncached(prompt)
+    with _INTENT_LOCK:
+        _INTENT_CACHE[key] = result
+        if len(_INTENT_CACHE) > _INTENT_CACHE_MAX:
+            _INTENT_CACHE.popitem(last=False)
+    return result
+
+def _parse_intent_uncached(prompt: str) -> Tuple[str,str]:
     resp = client().chat.completions.create(
         model=AOAI_DEPLOYMENT, temperature=0,
-        response_format={"type":"json_schema","json_schema":{"name":"Intent","schema":INTENT_SCHEMA}},
+        response_format=_INTENT_RF,
         messages=[
-            {"role":"system","content":SYSTEM_INTENT},
+            _INTENT_MSG_SYS,
             {"role":"user","content":prompt}
         ]
     )
     content = resp.choices[0].message.content
-    data = json.loads(content)
+    data = orjson.loads(content)
     person = (data.get("person_name") or "").strip()
     template = (data.get("template") or "europass").strip().lower()
     if template not in ("europass","kyndryl"):
@@ -297,131 +260,294 @@ def parse_intent_with_llm(prompt: str) -> Tuple[str,str]:
 
 def choose_best_blob_with_llm(person_name: str, candidates: List[str]) -> str:
     """Returns a single filename or 'NONE'."""
-    payload = {"person_name": person_name, "candidates": candidates}
+    return _pick_cached(person_name, tuple(candidates))
+
+@lru_cache(maxsize=1024)
+def _pick_cached(person_name: str, candidates: Tuple[str, ...]) -> str:
+    payload = {"person_name": person_name, "candidates": list(candidates)}
     resp = client().chat.completions.create(
         model=AOAI_DEPLOYMENT, temperature=0,
-        response_format={"type":"json_schema","json_schema":{"name":"BlobPick","schema":BLOB_PICK_SCHEMA}},
+        response_format=_BLOB_PICK_RF,
         messages=[
-            {"role":"system","content":SYSTEM_BLOB_PICK},
-            {"role":"user","content":json.dumps(payload, ensure_ascii=False)}
+            _BLOB_MSG_SYS,
+            {"role":"user","content":orjson.dumps(payload).decode()}
         ]
     )
     content = resp.choices[0].message.content
-    data = json.loads(content)
+    data = orjson.loads(content)
     best = (data.get("best") or "").strip()
     return best or "NONE"
 
+def parse_intent_and_pick_with_llm(prompt: str, candidates: List[str]) -> Tuple[str,str,str]:
+    """Returns (person_name, template|europass, filename|'NONE') from a single AOAI call."""
+    return _intent_pick_cached(" ".join(prompt.split()), tuple(candidates))
+
+@lru_cache(maxsize=512)
+def _intent_pick_cached(prompt: str, candidates: Tuple[str, ...]) -> Tuple[str,str,str]:
+    payload = {"request": prompt, "candidates": list(candidates)}
+    resp = client().chat.completions.create(
+        model=AOAI_DEPLOYMENT, temperature=0,
+        response_format=_INTENT_PICK_RF,
+        messages=[
+            _INTENT_PICK_MSG_SYS,
+            {"role":"user","content":orjson.dumps(payload).decode()}
+        ]
+    )
+    content = resp.choices[0].message.content
+    data = orjson.loads(content)
+    person = (data.get("person_name") or "").strip()
+    template = (data.get("template") or "europass").strip().lower()
+    if template not in ("europass","kyndryl"):
+        template = "europass"
+    best = (data.get("best") or "").strip()
+    return person, template, best or "NONE"
+
+async def _intent_for_request(prompt: str, f_blobs) -> Tuple[str,str,Optional[str]]:
+    """(person, template, pre-picked filename or None). The pick is only made in COMBINED_PICK mode."""
+    # Waits on the listing here, in the event loop, so no pool thread blocks on another pool task
+    if COMBINED_PICK:
+        try:
+            names = [b.name for b in await asyncio.wrap_future(f_blobs)]
+        except Exception:
+            names = []  # _chat_one reports the listing failure itself
+        if names:
+            return await _offload(parse_intent_and_pick_with_llm, prompt, names)
+    return (*(await _offload(parse_intent_with_llm, prompt)), None)
+
+_NAME_SPLIT = re.compile(r"[\W_]+")  # Unicode-aware: "José_Núñez" -> josé, núñez
+# Filler that shows up in prompts and deck names but never identifies the person
+_STOPWORDS = frozenset({"cv", "resume", "give", "me", "of", "for", "the", "a", "in", "template",
+                        "europass", "kyndryl", "pptx", "final", "latest", "new", "copy"})
+
+def _name_tokens(s: str) -> List[str]:
+    return [t for t in _NAME_SPLIT.split(s.lower()) if t and t not in _STOPWORDS]
+
+def _local_pick(person_name: str, candidates: List[str]) -> Optional[str]:
+    """Returns a filename when a local token/fuzzy match is unambiguous, else None (ask the LLM)."""
+    p_tokens = _name_tokens(person_name)
+    if not p_tokens:
+        return None
+    p_set, n_p = set(p_tokens), len(set(p_tokens))
+    # The person string is seq2 so difflib indexes it once for every candidate
+    sm = difflib.SequenceMatcher(None, b=" ".join(p_tokens))
+    top_score, top_name, second = 0.0, None, 0.0
+    full = []  # candidates containing every name token (at most two are tracked)
+    for name in candidates:
+        base = name.rsplit("/", 1)[-1]
+        n_tokens = _name_tokens(base.rsplit(".", 1)[0] if "." in base else base)
+        if not n_tokens:
+            continue
+        overlap = len(p_set.intersection(n_tokens)) / n_p
+        sm.set_seq1(" ".join(n_tokens))
+        # No shared token: the cheap upper bound is enough, it can only make us defer to the LLM
+        ratio = sm.ratio() if overlap else sm.real_quick_ratio()
+        score = (overlap + ratio) / 2
+        if overlap == 1.0 and len(full) < 2:
+            full.append(name)
+        if score > top_score:
+            top_score, top_name, second = score, name, top_score
+        elif score > second:
+            second = score
+        if second == 1.0:
+            return None  # two perfect matches: ambiguous no matter what follows
+    if top_name and top_score >= LOCAL_PICK_THRESHOLD and top_score - second >= LOCAL_PICK_MARGIN:
+        return top_name
+    # Only one deck carries the whole name (e.g. a long "..._cv_2024_v3" suffix dragging the ratio down)
+    if len(full) == 1 and full[0] == top_name:
+        return top_name
+    return None
+
 # ========== HTTP TRIGGER ==========
-def main(req: func.HttpRequest) -> func.HttpResponse:
+# Shared across invocations; main is async and every blocking call (AOAI, storage, downstream
+# HTTP) runs here so the worker's event loop keeps serving other invocations meanwhile
+_POOL = ThreadPoolExecutor(max_workers=int(_get("CHATCV_POOL_WORKERS", default="16")), thread_name_prefix="chatcv")
+
+async def _offload(fn, *args, **kwargs):
+    return await asyncio.wrap_future(_POOL.submit(fn, *args, **kwargs))
+
+# Constant bodies encoded once; _json_response passes bytes through as-is
+_ERR_INVALID_JSON    = orjson.dumps({"error":"Invalid JSON"})
+_ERR_MISSING_PROMPT  = orjson.dumps({"error":"Missing 'prompt'"})
+_GZIP_MIN_BYTES      = 1024  # below this the gzip header outweighs the savings
+
+def _json_response(req: func.HttpRequest, obj: Any, status_code: int = 200) -> func.HttpResponse:
+    body = obj if isinstance(obj, bytes) else orjson.dumps(obj)
+    if len(body) >= _GZIP_MIN_BYTES and "gzip" in (req.headers.get("Accept-Encoding") or ""):
+        return func.HttpResponse(gzip.compress(body, compresslevel=1), status_code=status_code,
+                                 mimetype="application/json", headers={"Content-Encoding": "gzip"})
+    return func.HttpResponse(body, status_code=status_code, mimetype="application/json")
+
+async def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info("chatcv triggered")
     if req.method != "POST":
         return func.HttpResponse("POST only", status_code=405)
 
     try:
-        body = req.get_json()
-    except ValueError:
-        return func.HttpResponse(json.dumps({"error":"Invalid JSON"}), status_code=400, mimetype="application/json")
-
-    prompt = (body.get("prompt") or "").strip()
+        body = orjson.loads(req.get_body() or b"null")
+    except orjson.JSONDecodeError:
+        body = None
+    if not isinstance(body, dict):
+        return _json_response(req, _ERR_INVALID_JSON, status_code=400)
+
+    # Batch: {"prompts": [...]} runs whole pipelines concurrently (bounded), sharing the pooled
+    # session, compiled template and SAS/intent caches; each prompt stays sequential internally
+    prompts = body.get("prompts")
+    if isinstance(prompts, list) and prompts:
+        if len(prompts) > MAX_BATCH:
+            return _json_response(req, {"error": f"Too many prompts ({len(prompts)}); at most {MAX_BATCH} per request"},
+                                  status_code=400)
+        sem = asyncio.Semaphore(BATCH_CONCURRENCY)
+        async def one(p: Any) -> Dict[str, Any]:
+            p = p.strip() if isinstance(p, str) else ""
+            if not p:
+                return {"error":"Missing 'prompt'"}
+            async with sem:
+                return await _chat_one(req, p)
+        results = await asyncio.gather(*(one(p) for p in prompts))
+        return _json_response(req, {"results": results}, status_code=200)
+
+    prompt = body.get("prompt")
+    prompt = prompt.strip() if isinstance(prompt, str) else ""
     if not prompt:
-        return func.HttpResponse(json.dumps({"error":"Missing 'prompt'"}), status_code=400, mimetype="application/json")
+        return _json_response(req, _ERR_MISSING_PROMPT, status_code=400)
+
+    return _json_response(req, await _chat_one(req, prompt), status_code=200)
+
+async def _pick_blob(person: str, names: List[str], pre_pick: Optional[str]) -> str:
+    """Best filename for the person among names, or 'NONE'."""
+    best = _local_pick(person, names)
+    if best:
+        logging.info(f"[chatcv] local pick: {best}")
+        return best
+    if pre_pick is not None:
+        return pre_pick  # already chosen by the combined intent+pick call
+    try:
+        return await _offload(choose_best_blob_with_llm, person, names)
+    except Exception:
+        logging.exception("blob pick failed")
+        return "NONE"
+
+async def _chat_one(req: func.HttpRequest, prompt: str) -> Dict[str, Any]:
+    """Runs one prompt end to end; returns the user-facing JSON payload (always HTTP 200)."""
+    # 1) Intent via AOAI, with the 'incoming' listing fetched concurrently (independent of the intent;
+    #    in COMBINED_PICK mode the intent call waits for the names and picks the blob too)
+    f_blobs  = _POOL.submit(list_recent_cv_blobs, 60)
+    f_intent = asyncio.ensure_future(_intent_for_request(prompt, f_blobs))
 
-    # 1) Intent via AOAI
     try:
-        person, template = parse_intent_with_llm(prompt)
+        person, template, pre_pick = await f_intent
     except Exception as e:
         logging.exception("intent parse failed")
-        return func.HttpResponse(json.dumps({
+        return {
             "message":"I couldn’t understand the request. Try: “Give CV of Ada Lovelace in kyndryl template”.",
             "details": f"intent-error: {e}"
-        }), status_code=200, mimetype="application/json")
+        }
 
     if not person:
-        return func.HttpResponse(json.dumps({
+        return {
             "message":"I couldn’t figure out the person’s name. Try: “Give CV of Ada Lovelace in europass template”."
-        }), status_code=200, mimetype="application/json")
+        }
 
     # 2) Find best blob from 'incoming' via AOAI
     try:
-        recent = list_recent_cv_blobs(limit=60)
+        recent = await asyncio.wrap_future(f_blobs)
         names = [b.name for b in recent]
     except Exception as e:
         logging.exception("blob list failed")
-        return func.HttpResponse(json.dumps({
+        return {
             "person_name": person, "template": template,
             "message": "I couldn’t access the 'incoming' container. Please check storage permissions/connection string.",
             "details": str(e)
-        }), status_code=200, mimetype="application/json")
+        }
 
     if not names:
-        return func.HttpResponse(json.dumps({
+        return {
             "person_name": person, "template": template,
             "message": f"No PPTX files found in '{INCOMING_CONTAINER}'. Please upload the CV PPTX and try again."
-        }), status_code=200, mimetype="application/json")
+        }
 
-    try:
-        best = choose_best_blob_with_llm(person, names)
-    except Exception as e:
-        logging.exception("blob pick failed")
-        best = "NONE"
+    best = await _pick_blob(person, names, pre_pick)
+    if (not best or best == "NONE") and BLOB_LIST_TTL_SEC > 0:
+        # The listing may predate a fresh upload (e.g. cvagent's normalize_only): list once more, uncached
+        try:
+            fresh = [b.name for b in await _offload(list_recent_cv_blobs, 60, True)]
+        except Exception:
+            fresh = names
+        if fresh != names:
+            names = fresh
+            best = await _pick_blob(person, names, None)
 
     if not best or best == "NONE":
-        return func.HttpResponse(json.dumps({
+        return {
             "person_name": person, "template": template,
             "message": f"I looked in '{INCOMING_CONTAINER}' but couldn’t find a matching PPTX for “{person}”. "
                        f"Please upload their PPTX to the '{INCOMING_CONTAINER}' container and try again."
-        }), status_code=200, mimetype="application/json")
+        }
 
     # 3) Pipeline: SAS → extract → normalize → render
     try:
-        sas = _blob_sas_url(INCOMING_CONTAINER, best)
+        sas = await _offload(_blob_sas_url, INCOMING_CONTAINER, best)
 
         # Extract
         extract_url = _build_url(req, PPTXEXTRACT_PATH, PPTXEXTRACT_KEY)
-        s1, d1, r1 = _post_json(extract_url, {"ppt_blob_sas": sas, "pptx_name": best})
+        s1, d1, r1 = await _offload(_post_json, extract_url, {"ppt_blob_sas": sas, "pptx_name": best})
         if s1 != 200 or not isinstance(d1, dict):
             msg = (d1.get("error") if isinstance(d1, dict) else r1)
-            return func.HttpResponse(json.dumps({
+            if not await _offload(_blob_exists, INCOMING_CONTAINER, best):
+                msg = f"Blob not found: {best}"
+            return {
                 "person_name": person, "template": template, "blob_name": best,
                 "message": f"Extraction failed ({s1}). {msg}"
-            }), status_code=200, mimetype="application/json")
+            }
 
         raw_cv = d1.get("raw") or d1.get("raw3") or d1
 
-        # Normalize (your existing normalizer service)
-        normalize_url = _build_url(req, CVNORMALIZE_PATH, CVNORMALIZE_KEY)
-        s2, d2, r2 = _post_json(normalize_url, {"raw": raw_cv, "pptx_name": best})
-        if s2 != 200 or not isinstance(d2, dict):
-            msg = (d2.get("error") if isinstance(d2, dict) else r2)
-            return func.HttpResponse(json.dumps({
-                "person_name": person, "template": template, "blob_name": best,
-                "message": f"Normalize failed ({s2}). {msg}"
-            }), status_code=200, mimetype="application/json")
-
-        cv = d2.get("cv") or d2.get("normalized") or d2
+        # Normalize (your existing normalizer; in-process when available, non-text extracts go over HTTP)
+        if _normalize_cv is not None and isinstance(raw_cv, str):
+            try:
+                cv = await _offload(_normalize_cv, raw_cv, timeout=HTTP_TIMEOUT_SEC)
+            except Exception as e:
+                return {
+                    "person_name": person, "template": template, "blob_name": best,
+                    "message": f"Normalize failed. {e}"
+                }
+        else:
+            normalize_url = _build_url(req, CVNORMALIZE_PATH, CVNORMALIZE_KEY)
+            s2, d2, r2 = await _offload(_post_json, normalize_url, {"raw": raw_cv, "pptx_name": best})
+            if s2 != 200 or not isinstance(d2, dict):
+                msg = (d2.get("error") if isinstance(d2, dict) else r2)
+                return {
+                    "person_name": person, "template": template, "blob_name": best,
+                    "message": f"Normalize failed ({s2}). {msg}"
+                }
+
+            cv = d2.get("cv") or d2.get("normalized") or d2
 
         # Render
         html = _html_from_cv(cv, template)
-        out_name = f"{os.path.splitext(os.path.basename(best))[0]}-{template}.pdf"
+        base = best.rsplit("/", 1)[-1]  # blob names always use '/'
+        stem = base.rsplit(".", 1)[0] if "." in base else base
+        out_name = f"{stem}-{template}.pdf"
         render_url = _build_url(req, RENDER_PATH, RENDER_KEY)
-        s3, d3, r3 = _post_json(render_url, {"out_name": out_name, "html": html, "css": ""})
+        s3, d3, r3 = await _offload(_post_json, render_url, {"out_name": out_name, "html": html, "css": ""},
+                                    compress=RENDER_GZIP)
         if s3 != 200 or not isinstance(d3, dict):
             msg = (d3.get("error") if isinstance(d3, dict) else r3)
-            return func.HttpResponse(json.dumps({
+            return {
                 "person_name": person, "template": template, "blob_name": best,
                 "message": f"Render failed ({s3}). {msg}"
-            }), status_code=200, mimetype="application/json")
+            }
 
         pdf_url = d3.get("pdf_url") or d3.get("url") or d3.get("sas_url") or d3.get("link")
-        return func.HttpResponse(json.dumps({
+        return {
             "person_name": person, "template": template, "blob_name": best,
             "pdf_url": pdf_url,
             "message": "Generated from the best-matching PPTX in 'incoming'."
-        }), status_code=200, mimetype="application/json")
+        }
 
     except Exception as e:
         logging.exception("chatcv fatal")
-        return func.HttpResponse(json.dumps({
+        return {
             "person_name": person, "template": template,
             "message": f"Something went wrong while generating the PDF. Details: {str(e)}"
-        }), status_code=200, mimetype="application/json")
+        }
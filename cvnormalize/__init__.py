@@ -1,7 +1,11 @@
-import os, json, logging
-from typing import Any, Dict, Optional
+import os, logging
+from typing import Any, Dict, Optional, TYPE_CHECKING
 import azure.functions as func
-from openai import AzureOpenAI
+import orjson
+
+# The SDK is imported on first use in client(), so rejected requests on a cold start never load it
+if TYPE_CHECKING:
+    from openai import AzureOpenAI
 
 def _get(name, *aliases, default=None):
     for k in (name, *aliases):
@@ -14,10 +18,11 @@ AOAI_KEY         = _get("AOAI_KEY", "AZURE_OPENAI_API_KEY")
 AOAI_DEPLOYMENT  = _get("AOAI_DEPLOYMENT", "AZURE_OPENAI_DEPLOYMENT", default="gpt-4.1")
 AOAI_API_VERSION = _get("AOAI_API_VERSION", "AZURE_OPENAI_API_VERSION", default="2024-10-21")
 
-_client: Optional[AzureOpenAI] = None
-def client() -> AzureOpenAI:
+_client: Optional["AzureOpenAI"] = None
+def client() -> "AzureOpenAI":
     global _client
     if _client is None:
+        from openai import AzureOpenAI
         _client = AzureOpenAI(azure_endpoint=AOAI_ENDPOINT, api_key=AOAI_KEY, api_version=AOAI_API_VERSION)
     return _client
 
@@ -71,16 +76,25 @@ Rules:
 Return ONLY JSON.
 """
 
-def _normalize(raw_text: str, blocks: Any, hints: Dict[str, Any]) -> Dict[str, Any]:
+def _normalize(raw_text: str, blocks: Any, hints: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
     payload = {"raw_text": raw_text, "blocks": blocks or [], "hints": hints or {}}
-    resp = client().chat.completions.create(
+    # A timeout is one deadline for the whole call (no SDK retries), like the HTTP hop it replaces had
+    c = client() if timeout is None else client().with_options(timeout=timeout, max_retries=0)
+    resp = c.chat.completions.create(
         model=AOAI_DEPLOYMENT, temperature=0.1, max_tokens=4000,
         response_format={"type":"json_schema","json_schema":{"name":"CVSchema","schema":CV_SCHEMA}},
         messages=[{"role":"system","content":SYSTEM_PROMPT},
-                  {"role":"user","content":json.dumps(payload, ensure_ascii=False)}]
+                  {"role":"user","content":orjson.dumps(payload).decode()}]
     )
     content = resp.choices[0].message.content
-    return json.loads(content)
+    return orjson.loads(content)
+
+def normalize_cv(raw_text: str, blocks: Any = None, hints: Optional[Dict[str, Any]] = None,
+                 timeout: Optional[float] = None) -> Dict[str, Any]:
+    """Normalized CV with provenance: the body of a 200 response's 'cv'. cvagent/chatcv call this in-process."""
+    cv = _normalize(raw_text, blocks, hints, timeout)
+    cv["provenance"] = {"model": AOAI_DEPLOYMENT, "normalized_at": __import__("datetime").datetime.utcnow().isoformat()+"Z"}
+    return cv
 
 def main(req: func.HttpRequest) -> func.HttpResponse:
     if req.method != "POST": return func.HttpResponse("POST only", status_code=405)
@@ -94,10 +108,9 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         return func.HttpResponse("Missing 'text' (or 'slides_text'/'raw')", status_code=400)
 
     try:
-        cv = _normalize(text, blocks, hints)
-        cv["provenance"] = {"model": AOAI_DEPLOYMENT, "normalized_at": __import__("datetime").datetime.utcnow().isoformat()+"Z"}
+        cv = normalize_cv(text, blocks, hints)
     except Exception as e:
         logging.exception("normalize failed")
-        return func.HttpResponse(json.dumps({"error": f"normalize failed: {e}"}), status_code=502, mimetype="application/json")
+        return func.HttpResponse(orjson.dumps({"error": f"normalize failed: {e}"}), status_code=502, mimetype="application/json")
 
-    return func.HttpResponse(json.dumps({"cv": cv}), status_code=200, mimetype="application/json")
+    return func.HttpResponse(orjson.dumps({"cv": cv}), status_code=200, mimetype="application/json")
@@ -1,7 +1,10 @@
-import io, os, re, json, logging
+import io, os, re, logging
 from typing import Any, Dict, List, Optional, Tuple
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import azure.functions as func
 from pptx import Presentation
 from pptx.enum.shapes import MSO_SHAPE_TYPE
@@ -12,13 +15,32 @@ EMAIL_RE = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}", re.I)
 PHONE_RE = re.compile(r"(?:\+?\d[\d ()\-]{7,}\d)")
 URL_RE   = re.compile(r"(?:(?:https?://)|(?:www\.))\S+", re.I)
 LINKEDIN_RE = re.compile(r"(?:linkedin\.com/[A-Za-z0-9_\-/]+)", re.I)
+CELL_NL_RE  = re.compile(r"\s*\n\s*")
 
 def _px(emu): return int(emu / EMU_PER_PX)
 
-def _download_pptx(sas: str) -> bytes:
-    r = requests.get(sas, timeout=180)
-    r.raise_for_status()
-    return r.content
+# Pooled session: every download goes to the same storage account, so keep-alive skips the TLS handshake
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=16,
+                                       max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[500, 502, 503, 504])))
+_SESSION.headers.update({"User-Agent": "cvagent-pptxextract"})
+
+MAX_PPTX_BYTES = int(os.environ.get("MAX_PPTX_MB", "200")) * 1024 * 1024
+
+def _download_pptx(sas: str) -> io.BytesIO:
+    # Streamed straight into the buffer python-pptx reads, capped so an oversized blob fails fast
+    with _SESSION.get(sas, timeout=180, stream=True) as r:
+        r.raise_for_status()
+        cl = r.headers.get("Content-Length")
+        if cl and cl.isdigit() and int(cl) > MAX_PPTX_BYTES:
+            raise ValueError(f"PPTX is {int(cl)} bytes; limit is {MAX_PPTX_BYTES}")
+        buf = io.BytesIO()
+        for chunk in r.iter_content(chunk_size=1 << 20):
+            buf.write(chunk)
+            if buf.tell() > MAX_PPTX_BYTES:
+                raise ValueError(f"PPTX exceeds {MAX_PPTX_BYTES} bytes")
+    buf.seek(0)
+    return buf
 
 def _text_from_textframe(tf) -> Tuple[List[str], Optional[float]]:
     lines: List[str] = []
@@ -43,7 +65,7 @@ def _lines_from_table(tbl) -> List[str]:
         cells = []
         for c in r.cells:
             t = (c.text or "").strip()
-            if t: t = re.sub(r"\s*\n\s*", " / ", t)
+            if t: t = CELL_NL_RE.sub(" / ", t)
             cells.append(t)
         row_txt = " | ".join(filter(None, cells)).strip()
         if row_txt: out.append(row_txt)
@@ -142,8 +164,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
     if not sas: return func.HttpResponse("Missing 'ppt_blob_sas'", status_code=400)
 
     try:
-        data = _download_pptx(sas)
-        prs = Presentation(io.BytesIO(data))
+        prs = Presentation(_download_pptx(sas))
     except Exception as e:
         logging.exception("Failed to open PPTX")
         return func.HttpResponse(f"Could not read PPTX: {e}", status_code=400)
@@ -159,5 +180,5 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
     hints = _gather_hints(all_text)
 
     return func.HttpResponse(
-        json.dumps({"ok": True, "slides": slides, "slides_text": all_text, "raw": all_text, "hints": hints}),
+        orjson.dumps({"ok": True, "slides": slides, "slides_text": all_text, "raw": all_text, "hints": hints}),
         status_code=200, mimetype="application/json")
@@ -1,7 +1,8 @@
-import os, json, uuid, traceback
+import os, uuid, traceback
+import orjson
 import azure.functions as func
-from urllib.request import urlopen, Request
-from urllib.error import HTTPError, URLError
+import requests
+from requests.adapters import HTTPAdapter
 
 try:
     from fpdf import FPDF
@@ -24,8 +25,16 @@ def _accent():
 ACCENT = _accent()
 HAIR   = tuple(int(c*0.75) for c in ACCENT)  # slightly darker for rules
 
+# Pooled keep-alive session: the cv_json_url fetch and the PDF PUT usually hit the same storage account
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=16))
+_SESSION.headers.update({"User-Agent": "cvagent-renderpdf"})
+
 def http_get_json(url: str) -> dict:
-    with urlopen(url) as r: return json.loads(r.read().decode("utf-8"))
+    r = _SESSION.get(url, timeout=30)
+    r.raise_for_status()
+    # Parse the body bytes directly: no intermediate str copy of a potentially large CV
+    return orjson.loads(r.content)
 
 def put_blob_with_sas(container_sas: str, blob_name: str, content: bytes, content_type="application/pdf") -> str:
     if "?" in container_sas:
@@ -33,11 +42,10 @@ def put_blob_with_sas(container_sas: str, blob_name: str, content: bytes, conten
         dest = f"{prefix.rstrip('/')}/{blob_name}?{qs}"
     else:
         dest = f"{container_sas.rstrip('/')}/{blob_name}"
-    req = Request(dest, data=content, method="PUT",
-                  headers={"x-ms-blob-type":"BlockBlob","Content-Type":content_type})
-    with urlopen(req) as r:
-        _ = r.read()
-        return dest
+    r = _SESSION.put(dest, data=content, timeout=60,
+                     headers={"x-ms-blob-type":"BlockBlob","Content-Type":content_type})
+    r.raise_for_status()
+    return dest
 
 # ---------- font / text helpers ----------
 def _font_paths():
@@ -45,18 +53,25 @@ def _font_paths():
     bld = os.path.join(FONT_DIR,"DejaVuSans-Bold.ttf")
     return (reg if os.path.exists(reg) else None, bld if os.path.exists(bld) else None)
 
+# Font files don't change while the worker runs: stat them once, not on every heading
+FONT_REG, FONT_BOLD = _font_paths()
+
+def _add_font_once(pdf: "FPDF", style: str, path: str) -> bool:
+    # add_font re-resolves the file and warns (walking the stack) when the face is already registered
+    if f"dejavu{style}" in pdf.fonts: return True
+    try:
+        pdf.add_font("DejaVu", style, path)
+        return True
+    except Exception:
+        return False
+
 def use_unicode(pdf: "FPDF", size=10, bold=False) -> bool:
     """Try to use DejaVu (Unicode). Returns True if active; else falls back to Helvetica."""
-    reg,bld = _font_paths()
     fam="DejaVu"
-    if reg:
-        try:
-            pdf.add_font(fam,"",reg,uni=True)
-        except Exception:
-            pass
-        if bold and bld:
+    if FONT_REG:
+        _add_font_once(pdf, "", FONT_REG)
+        if bold and FONT_BOLD and _add_font_once(pdf, "B", FONT_BOLD):
             try:
-                pdf.add_font(fam,"B",bld,uni=True)
                 pdf.set_font(fam,"B",size); return True
             except Exception:
                 pass
@@ -204,9 +219,10 @@ def europass(cv: dict) -> bytes:
     if exps:
         hsec_right(pdf,"WORK EXPERIENCE", right_x, right_w, unicode_ok)
         for e in exps:
-            hdr = " · ".join([x for x in [e.get("title"), e.get("company"), e.get("employment_type")] if x])
-            dates = " — ".join([x for x in [e.get("start_date"), e.get("end_date") or "Present"] if x])
-            where = e.get("location")
+            get = e.get
+            hdr = " · ".join([x for x in [get("title"), get("company"), get("employment_type")] if x])
+            dates = " — ".join([x for x in [get("start_date"), get("end_date") or "Present"] if x])
+            where = get("location")
 
             if unicode_ok: use_unicode(pdf, 11, True)
             else: pdf.set_font("Helvetica","B",11)
@@ -217,8 +233,8 @@ def europass(cv: dict) -> bytes:
             meta = " | ".join([x for x in [dates, where] if x])
             if meta: mc_w(pdf, right_w, meta, h=5.0, align="L", unicode_ok=unicode_ok)
 
-            bullet_list(pdf, right_w, (e.get("bullets") or [])[:14], unicode_ok=unicode_ok)
-            tech = e.get("tech") or []
+            bullet_list(pdf, right_w, (get("bullets") or [])[:14], unicode_ok=unicode_ok)
+            tech = get("tech") or []
             if tech: mc_w(pdf, right_w, "Tech: " + ", ".join(tech), h=5.0, align="J", unicode_ok=unicode_ok)
             pdf.ln(1.2)
 
@@ -227,8 +243,9 @@ def europass(cv: dict) -> bytes:
     if edus:
         hsec_right(pdf,"EDUCATION AND TRAINING", right_x, right_w, unicode_ok)
         for ed in edus:
-            parts=[ed.get("degree"), ed.get("field") or ed.get("field_of_study"), ed.get("institution") or ed.get("school")]
-            years = " ".join([str(ed.get("start_year") or ""), str(ed.get("end_year") or "")]).strip()
+            get = ed.get
+            parts=[get("degree"), get("field") or get("field_of_study"), get("institution") or get("school")]
+            years = " ".join([str(get("start_year") or ""), str(get("end_year") or "")]).strip()
             if years: parts.append(years)
             mc_w(pdf, right_w, " · ".join([p for p in parts if p]), h=5.0, align="L", unicode_ok=unicode_ok)
             pdf.ln(0.5)
@@ -271,26 +288,24 @@ def render(cv: dict, template: str) -> bytes:
 async def main(req: func.HttpRequest) -> func.HttpResponse:
     try:
         if FPDF is None:
-            return func.HttpResponse(json.dumps({"error":"fpdf2 not found","detail":FERR}), status_code=500, mimetype="application/json")
+            return func.HttpResponse(orjson.dumps({"error":"fpdf2 not found","detail":FERR}), status_code=500, mimetype="application/json")
         if not PDF_OUT_BASE:
-            return func.HttpResponse(json.dumps({"error":"Missing app setting PDF_OUT_BASE"}), status_code=500, mimetype="application/json")
+            return func.HttpResponse(orjson.dumps({"error":"Missing app setting PDF_OUT_BASE"}), status_code=500, mimetype="application/json")
 
-        body = req.get_json()
+        body = orjson.loads(req.get_body())
         name_hint = body.get("name_hint","cv")
 
         if "cv" in body: cv = body["cv"]
         elif "cv_json_url" in body: cv = http_get_json(body["cv_json_url"])
         else:
-            return func.HttpResponse(json.dumps({"error":"Provide 'cv' or 'cv_json_url'"}), status_code=400, mimetype="application/json")
+            return func.HttpResponse(orjson.dumps({"error":"Provide 'cv' or 'cv_json_url'"}), status_code=400, mimetype="application/json")
 
         pdf_bytes = render(cv, (body.get("template") or "europass"))
         fname = f"europass-{name_hint}-{uuid.uuid4()}.pdf"
         url = put_blob_with_sas(PDF_OUT_BASE, fname, pdf_bytes)
-        return func.HttpResponse(json.dumps({"pdf_url":url}), mimetype="application/json")
-    except (HTTPError, URLError) as e:
-        detail=""; 
-        try: detail = e.read().decode("utf-8","ignore")
-        except Exception: pass
-        return func.HttpResponse(json.dumps({"error":"network","detail":str(e),"body":detail}), status_code=500, mimetype="application/json")
+        return func.HttpResponse(orjson.dumps({"pdf_url":url}), mimetype="application/json")
+    except requests.RequestException as e:
+        detail = e.response.text if e.response is not None else ""
+        return func.HttpResponse(orjson.dumps({"error":"network","detail":str(e),"body":detail}), status_code=500, mimetype="application/json")
     except Exception as e:
-        return func.HttpResponse(json.dumps({"error":str(e),"trace":traceback.format_exc()}), status_code=500, mimetype="application/json")
+        return func.HttpResponse(orjson.dumps({"error":str(e),"trace":traceback.format_exc()}), status_code=500, mimetype="application/json")
@@ -1,12 +1,16 @@
 # renderpdf_html/__init__.py
-import json, os, io, tempfile, traceback
-from datetime import datetime, timedelta
+import os, io, zlib, tempfile, traceback
+from datetime import datetime, timedelta, timezone
 import azure.functions as func
+import orjson
 
 from azure.storage.blob import BlobServiceClient, ContentSettings
 from azure.storage.blob import generate_blob_sas, BlobSasPermissions
+from azure.core.exceptions import ResourceExistsError
 from playwright.sync_api import sync_playwright
 
+from shared_code.sas import SasUrlCache
+
 # ---- Config (keeps your conventions) ----
 ACCOUNT_URL     = os.environ.get("AZURE_STORAGE_BLOB_URL") or os.environ.get("BLOB_ACCOUNT_URL")
 CONN_STR        = os.environ.get("AzureWebJobsStorage") or os.environ.get("AZURE_STORAGE_CONNECTION_STRING")
@@ -17,39 +21,73 @@ PRIMARY_RGB     = os.environ.get("PDF_PRIMARY_RGB", "0,102,204")
 # SAS expiry in minutes for returned link
 SAS_MINUTES     = int(os.environ.get("SAS_MINUTES", "120"))
 
+# Cap on a gzip body's inflated size, so a small request can't expand into a decompression bomb
+MAX_BODY_BYTES  = int(os.environ.get("RENDER_MAX_BODY_MB", "20")) * 1024 * 1024
+
+# Storage clients are built once per worker and reused: each from_connection_string spins up a new
+# pipeline (and connection pool), and create_container is a round trip we only need once per container
+_bsc = None
+_CONTAINER_CLIENTS = {}
+_ENSURED_CONTAINERS = set()
+
+def _service_client() -> BlobServiceClient:
+    global _bsc
+    if _bsc is None:
+        _bsc = BlobServiceClient.from_connection_string(CONN_STR)
+    return _bsc
+
+def _container_client(container: str):
+    cc = _CONTAINER_CLIENTS.get(container)
+    if cc is None:
+        cc = _CONTAINER_CLIENTS[container] = _service_client().get_container_client(container)
+    return cc
+
 def _blob_client(container: str, blob_name: str):
-    bsc = BlobServiceClient.from_connection_string(CONN_STR)
-    return bsc.get_blob_client(container=container, blob=blob_name)
+    return _container_client(container).get_blob_client(blob_name)
 
 def _ensure_container(container: str):
+    if container in _ENSURED_CONTAINERS:
+        return
     try:
-        bsc = BlobServiceClient.from_connection_string(CONN_STR)
-        bsc.create_container(container)
-    except Exception:
+        _container_client(container).create_container()
+    except ResourceExistsError:
         pass
+    except Exception:
+        return  # not remembered: try again next time; the upload surfaces the real error
+    _ENSURED_CONTAINERS.add(container)
+
+# SAS signing inputs are fixed for the worker's lifetime; read them once
+_SAS_ACCOUNT_NAME = os.environ.get("STORAGE_ACCOUNT_NAME")
+_SAS_ACCOUNT_KEY  = os.environ.get("STORAGE_ACCOUNT_KEY")
+_SAS_READ_PERM    = BlobSasPermissions(read=True)
+
+# Re-rendering the same out_name overwrites the blob in place, so its cached SAS stays valid
+_SAS_CACHE = SasUrlCache()
 
 def _make_sas(container: str, blob_name: str, minutes: int = SAS_MINUTES) -> str:
-    # Build SAS with read perms
-    from azure.storage.blob import generate_blob_sas, BlobSasPermissions
-    from datetime import datetime, timezone
-    account_name = os.environ.get("STORAGE_ACCOUNT_NAME")
-    account_key  = os.environ.get("STORAGE_ACCOUNT_KEY")
     # If you don't expose name/key as app settings, SAS is optional; the raw URL still works if container is public.
-    if not (account_name and account_key):
+    if not (_SAS_ACCOUNT_NAME and _SAS_ACCOUNT_KEY):
         # Fall back to regular URL (no SAS)
         base = ACCOUNT_URL or ""
         return f"{base}/{container}/{blob_name}"
 
+    hit = _SAS_CACHE.get(container, blob_name, minutes)
+    if hit:
+        return hit
+
+    expiry = datetime.now(timezone.utc) + timedelta(minutes=minutes)
     sas = generate_blob_sas(
-        account_name=account_name,
+        account_name=_SAS_ACCOUNT_NAME,
         container_name=container,
         blob_name=blob_name,
-        account_key=account_key,
-        permission=BlobSasPermissions(read=True),
-        expiry=datetime.utcnow() + timedelta(minutes=minutes),
+        account_key=_SAS_ACCOUNT_KEY,
+        permission=_SAS_READ_PERM,
+        expiry=expiry,
     )
-    base = ACCOUNT_URL or f"https://{account_name}.blob.core.windows.net"
-    return f"{base}/{container}/{blob_name}?{sas}"
+    base = ACCOUNT_URL or f"https://{_SAS_ACCOUNT_NAME}.blob.core.windows.net"
+    url = f"{base}/{container}/{blob_name}?{sas}"
+    _SAS_CACHE.put(container, blob_name, url, expiry)
+    return url
 
 def _render_pdf_bytes(html: str, css: str = "") -> bytes:
     # Write temp HTML; keep CSS inline to avoid file path shenanigans on Functions.
@@ -90,12 +128,32 @@ def _render_pdf_bytes(html: str, css: str = "") -> bytes:
             browser.close()
             return pdf_bytes
 
+class _BodyTooLarge(ValueError):
+    pass
+
+def _json_body(req: func.HttpRequest) -> dict:
+    # chatcv gzips the (HTML-heavy) render payload; plain JSON bodies still work
+    if (req.headers.get("Content-Encoding") or "").lower() == "gzip":
+        d = zlib.decompressobj(16 + zlib.MAX_WBITS)  # gzip container
+        raw = d.decompress(req.get_body(), MAX_BODY_BYTES)
+        if d.unconsumed_tail:
+            raise _BodyTooLarge()
+        return orjson.loads(raw)
+    return orjson.loads(req.get_body())
+
 def main(req: func.HttpRequest) -> func.HttpResponse:
     try:
-        payload = req.get_json()
+        payload = _json_body(req)
+    except _BodyTooLarge:
+        return func.HttpResponse(
+            orjson.dumps({"error": f"Decompressed body exceeds {MAX_BODY_BYTES // (1024 * 1024)} MB"}),
+            mimetype="application/json", status_code=413
+        )
     except Exception:
+        payload = None
+    if not isinstance(payload, dict):
         return func.HttpResponse(
-            json.dumps({"error": "Invalid JSON body"}), mimetype="application/json", status_code=400
+            orjson.dumps({"error": "Invalid JSON body"}), mimetype="application/json", status_code=400
         )
 
     html       = payload.get("html")
@@ -105,7 +163,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
 
     if not html:
         return func.HttpResponse(
-            json.dumps({"error": "Missing 'html' in request body"}), mimetype="application/json", status_code=400
+            orjson.dumps({"error": "Missing 'html' in request body"}), mimetype="application/json", status_code=400
         )
 
     # Default filename if UI didn't send one
@@ -118,7 +176,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         pdf_bytes = _render_pdf_bytes(html, css)
     except Exception as e:
         return func.HttpResponse(
-            json.dumps({"error": f"HTML->PDF failed: {str(e)}", "trace": traceback.format_exc()}),
+            orjson.dumps({"error": f"HTML->PDF failed: {str(e)}", "trace": traceback.format_exc()}),
             mimetype="application/json",
             status_code=500,
         )
@@ -133,13 +191,13 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         )
         sas_url = _make_sas(container, out_name)
         return func.HttpResponse(
-            json.dumps({"ok": True, "pdf_url": sas_url, "blob": {"container": container, "name": out_name}}),
+            orjson.dumps({"ok": True, "pdf_url": sas_url, "blob": {"container": container, "name": out_name}}),
             mimetype="application/json",
             status_code=200,
         )
     except Exception as e:
         return func.HttpResponse(
-            json.dumps({"error": f"Upload failed: {str(e)}", "trace": traceback.format_exc()}),
+            orjson.dumps({"error": f"Upload failed: {str(e)}", "trace": traceback.format_exc()}),
             mimetype="application/json",
             status_code=500,
         )
@@ -11,6 +11,18 @@ def _safe_join(base, *paths):
         raise ValueError("Path traversal detected")
     return final
 
+# The UI pages (inline logo SVG included) are static for a deployment: read each once per worker.
+# SPA routes served from index.html are also keyed by the requested path; those aliases are client-chosen, so capped.
+_FILE_CACHE = {}
+_SPA_ALIASES_MAX = 256
+_spa_aliases = 0
+
+def _alias(requested: str, entry) -> None:
+    global _spa_aliases
+    if _spa_aliases < _SPA_ALIASES_MAX:
+        _spa_aliases += 1
+        _FILE_CACHE[requested] = entry
+
 def main(req: func.HttpRequest) -> func.HttpResponse:
     # Route param {path}
     rel = (req.route_params.get("path") or "").strip()
@@ -22,9 +34,18 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
     except ValueError:
         return func.HttpResponse("Forbidden", status_code=403)
 
+    requested = file_path
+    hit = _FILE_CACHE.get(requested)
+    if hit is not None:
+        return func.HttpResponse(body=hit[0], status_code=200, mimetype=hit[1])
+
     # SPA fallback: if missing and no extension, try index.html
     if not os.path.isfile(file_path) and "." not in os.path.basename(rel):
         file_path = _safe_join(BASE_DIR, "index.html")
+        hit = _FILE_CACHE.get(file_path)
+        if hit is not None:
+            _alias(requested, hit)
+            return func.HttpResponse(body=hit[0], status_code=200, mimetype=hit[1])
 
     if not os.path.isfile(file_path):
         return func.HttpResponse("Not Found", status_code=404)
@@ -36,8 +57,12 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
     except Exception as e:
         return func.HttpResponse(f"Read error: {e}", status_code=500)
 
+    mimetype = ctype or "application/octet-stream"
+    entry = _FILE_CACHE[file_path] = (data, mimetype)
+    if requested != file_path:
+        _alias(requested, entry)
     return func.HttpResponse(
         body=data,
         status_code=200,
-        mimetype=ctype or "application/octet-stream"
+        mimetype=mimetype
     )
@@ -0,0 +1 @@
+# Helpers shared by the function folders (no function.json here, so the host never loads this as a function)
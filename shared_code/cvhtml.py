@@ -0,0 +1,126 @@
+# shared_code/cvhtml.py — normalized CV JSON → the HTML that renderpdf_html prints (chatcv, cvagent)
+from typing import Optional
+from jinja2 import Environment, DictLoader, FileSystemBytecodeCache, select_autoescape
+
+_EUROPASS_HTML = """<!doctype html>
+<html><head><meta charset="utf-8"/>
+<title>{{ person.full_name or 'Curriculum Vitae' }}</title>
+<style>
+  @page { size: A4; margin: 10mm }
+  body{margin:0;font-family:"DejaVu Sans",Arial,Helvetica,sans-serif;font-size:12px;color:#0f172a}
+  .eu-root{display:grid;grid-template-columns:320px 1fr;min-height:100vh}
+  .eu-side{background:{{ side_bg }};border-right:1px solid {{ side_border }};padding:22px}
+  .eu-main{padding:22px 26px}
+  .eu-name{font-size:26px;font-weight:800;margin:0}
+  .eu-title{font-size:13px;color:#475569;margin-top:4px}
+  .eu-kv{display:grid;grid-template-columns:22px 1fr;gap:10px;margin:6px 0}
+  .ico{width:22px;height:22px;border-radius:6px;background:#e2e8f0;display:flex;align-items:center;justify-content:center;font-size:12px}
+  .eu-sec{margin-top:16px}
+  .eu-sec h2{font-size:14px;font-weight:800;margin:0 0 10px;text-transform:uppercase;letter-spacing:.06em}
+  .eu-chip{display:inline-block;background:#eef2ff;color:#3730a3;border:1px solid #e0e7ff;border-radius:999px;padding:3px 10px;margin:3px 6px 0 0;font-size:11px}
+  .eu-job{margin:12px 0 10px}
+  .line2{color:#64748b;font-size:12px;margin-top:2px}
+  .desc{margin-top:6px}
+  .eu-job ul{margin:6px 0 0 18px}
+  .hr{height:1px;background:linear-gradient(90deg,#e5e7eb 60%,transparent 0) repeat-x;background-size:8px 1px;margin:14px 0}
+</style></head>
+<body>
+<div class="eu-root">
+  <aside class="eu-side">
+    <h1 class="eu-name">{{ person.full_name or '' }}</h1>
+    {% if person.title %}<div class="eu-title">{{ person.title }}</div>{% endif %}
+    <div>
+      {% for c in contacts %}
+        <div class="eu-kv"><div class="ico">{{ c.ico }}</div><div>{{ c.txt }}</div></div>
+      {% endfor %}
+    </div>
+    {% if skills %}
+    <div class="eu-sec"><h2>Skills</h2><div>{% for s in skills %}<span class="eu-chip">{{ s }}</span>{% endfor %}</div></div>
+    {% endif %}
+    {% if languages %}
+    <div class="eu-sec"><h2>Languages</h2><div>{% for l in languages %}<span class="eu-chip">{{ l.name }}{% if l.level %} — {{ l.level }}{% endif %}</span>{% endfor %}</div></div>
+    {% endif %}
+  </aside>
+  <main class="eu-main">
+    {% if summary %}
+      <section class="eu-sec"><h2>About Me</h2><div>{{ summary }}</div></section><div class="hr"></div>
+    {% endif %}
+    {% if experiences %}
+      <section class="eu-sec"><h2>Work Experience</h2>
+        {% for e in experiences %}
+          <div class="eu-job">
+            <div class="line1"><strong>{{ e.title }}</strong> — {{ e.company }}</div>
+            <div class="line2">{{ e.start_date }}{% if e.end_date %} – {{ e.end_date }}{% else %} – Present{% endif %}{% if e.location %} • {{ e.location }}{% endif %}</div>
+            {% if e.description %}<div class="desc">{{ e.description }}</div>{% endif %}
+            {% if e.bullets %}<ul>{% for b in e.bullets %}<li>{{ b }}</li>{% endfor %}</ul>{% endif %}
+          </div>
+        {% endfor %}
+      </section>
+    {% endif %}
+    {% if education %}
+      <section class="eu-sec"><h2>Education & Training</h2>
+        {% for ed in education %}
+          <div class="eu-edu">
+            <div class="line1"><strong>{{ ed.degree or ed.title }}</strong> — {{ ed.institution }}</div>
+            <div class="line2">{{ ed.start_date }}{% if ed.end_date %} – {{ ed.end_date }}{% endif %}{% if ed.location %} • {{ ed.location }}{% endif %}</div>
+            {% if ed.details %}<div class="desc">{{ ed.details }}</div>{% endif %}
+          </div>
+        {% endfor %}
+      </section>
+    {% endif %}
+  </main>
+</div>
+</body></html>
+"""
+
+# Sidebar palette per template; Kyndryl: red sidebar, main stays black on white
+_PALETTES = {
+    "europass": {"side_bg": "#f8fafc", "side_border": "#e5e7eb"},
+    "kyndryl":  {"side_bg": "#F9423A", "side_border": "#a60f24"},
+}
+
+# Compile once at import; one template serves both palettes
+def _minify(tpl: str) -> str:
+    # One element/rule per line in the source, so indentation and newlines never carry content
+    return "".join(line.strip() for line in tpl.splitlines())
+
+def _bytecode_cache() -> Optional[FileSystemBytecodeCache]:
+    # Compiled template code persisted across cold starts skips Jinja's parse + compile. No directory argument:
+    # Jinja's default is a per-user 0700 dir whose owner it verifies, so nobody else can plant bytecode there.
+    try:
+        return FileSystemBytecodeCache()
+    except (OSError, RuntimeError):  # RuntimeError: the default dir exists but isn't safely ours
+        return None
+
+_ENV = Environment(loader=DictLoader({"cv.html": _minify(_EUROPASS_HTML)}),
+                   autoescape=select_autoescape(["html"]), trim_blocks=True, lstrip_blocks=True,
+                   bytecode_cache=_bytecode_cache())
+_CV_TMPL = _ENV.get_template("cv.html")
+
+# (icon, personal_info key) in display order; None is the composed address line
+_CONTACT_FIELDS = (("@", "email"), ("☎", "phone"), ("in", "linkedin"), ("🌐", "website"),
+                   ("📍", None), ("🎂", "date_of_birth"), ("⚧", "gender"), ("🌎", "nationality"))
+
+def html_from_cv(cv: dict, template_name: str = "europass") -> str:
+    palette = _PALETTES.get((template_name or "europass").lower(), _PALETTES["europass"])
+    pi = (cv.get("personal_info") or cv.get("personal") or {}) if isinstance(cv, dict) else {}
+    pi_get, cv_get = pi.get, cv.get
+    addr = ", ".join(filter(None, (pi_get("address"), pi_get("city"), pi_get("country"))))
+    contacts = [{"ico": ico, "txt": v} for ico, k in _CONTACT_FIELDS
+                for v in ((addr if k is None else pi_get(k)),) if v]
+    # Same skill listed under several groups renders once; dict keeps first-seen order in O(n).
+    # Non-string items (e.g. an LLM-emitted {"name": ...}) are stringified, as the template would, so they stay hashable.
+    # ui/index.html's preview applies the same dedupe.
+    skills = list(dict.fromkeys(s if isinstance(s, str) else str(s)
+                                for g in (cv_get("skills_groups") or ()) for s in (g.get("items") or ()) if s))
+    model = {
+        "person": {"full_name": pi_get("full_name") or cv_get("name"),
+                   "title":     pi_get("headline")  or cv_get("title")},
+        "contacts": contacts,
+        "skills": skills,
+        "languages": cv_get("languages") or [],
+        "summary": cv_get("summary") or pi_get("summary"),
+        "experiences": cv_get("work_experience") or cv_get("experience") or [],
+        "education": cv_get("education") or [],
+    }
+    return _CV_TMPL.render(**model, **palette)
@@ -0,0 +1,110 @@
+# shared_code/downstream.py — calls from the orchestrators (chatcv, cvagent) to the other functions
+import os, logging, gzip, threading
+from urllib.parse import urlsplit
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import azure.functions as func
+
+# ==============================================================
+# CONFIG
+# ==============================================================
+BASE_URL = (os.environ.get("DOWNSTREAM_BASE_URL")
+            or os.environ.get("FUNCS_BASE_URL") or "").rstrip("/")
+
+PPTXEXTRACT_PATH = os.environ.get("PPTXEXTRACT_PATH") or "/api/pptxextract"
+CVNORMALIZE_PATH = os.environ.get("CVNORMALIZE_PATH") or "/api/cvnormalize"
+RENDER_PATH      = os.environ.get("RENDER_PATH")      or "/api/renderpdf_html"
+
+PPTXEXTRACT_KEY  = os.environ.get("PPTXEXTRACT_KEY", "")
+CVNORMALIZE_KEY  = os.environ.get("CVNORMALIZE_KEY", "")
+RENDER_KEY       = os.environ.get("RENDER_KEY", "")
+
+HTTP_TIMEOUT_SEC  = int(os.environ.get("HTTP_TIMEOUT_SEC") or "180")
+DOWNSTREAM_WARMUP = os.environ.get("DOWNSTREAM_WARMUP", "1") not in ("0", "false", "False")
+
+# cvnormalize ships in this function app: call it in-process instead of an HTTPS hop back through the front end.
+# USE_HTTP_NORMALIZE=1 keeps the hop (e.g. when CVNORMALIZE_PATH is served by another deployment).
+normalize_cv = None
+if os.environ.get("USE_HTTP_NORMALIZE") != "1":
+    try:
+        from cvnormalize import normalize_cv
+    except ImportError:
+        logging.warning("[downstream] cvnormalize not importable; normalizing over HTTP")
+
+# ==============================================================
+# HTTP
+# ==============================================================
+# One pooled keep-alive session per worker: extract/normalize/render hit the same Functions host back to back.
+# Retries cover failed connects; gateway 5xx are retried for idempotent methods only (urllib3 default).
+SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=32, pool_maxsize=64,
+                       max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504]))
+SESSION.mount("https://", _ADAPTER)
+SESSION.mount("http://", _ADAPTER)
+SESSION.headers.update({"User-Agent": "cvagent"})
+_JSON_HEADERS      = {"Content-Type": "application/json"}
+_GZIP_JSON_HEADERS = {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}" if parts.scheme and parts.netloc else ""
+
+def _warm_downstream() -> None:
+    # Pay DNS + TCP + TLS for the downstream host(s) now, not on the first request's extract hop.
+    # Relative paths resolve against this app, whose host Azure exposes as WEBSITE_HOSTNAME.
+    # Origins come from the configured paths only, never from the keyed URLs, so no function key leaves in a probe.
+    own = BASE_URL or (f"https://{os.environ['WEBSITE_HOSTNAME']}" if os.environ.get("WEBSITE_HOSTNAME") else "")
+    origins = {_origin(p if p.startswith("http") else own)
+               for p in (PPTXEXTRACT_PATH, CVNORMALIZE_PATH, RENDER_PATH)}
+    for origin in filter(None, origins):
+        try:
+            SESSION.head(origin + "/", timeout=5, allow_redirects=False)
+        except Exception as e:
+            logging.info(f"[downstream] warmup {origin} skipped: {e}")
+
+# Imported once per worker, however many functions use it
+if DOWNSTREAM_WARMUP:
+    threading.Thread(target=_warm_downstream, name="downstream-warmup", daemon=True).start()
+
+def with_key(url: str, key: str) -> str:
+    if key:
+        url += ("&" if "?" in url else "?") + "code=" + key
+    return url
+
+# (path, key) -> full URL, resolved once for targets that don't depend on the request host
+_URLS = {
+    (path, key): with_key(path if path.startswith("http") else f"{BASE_URL}{path}", key)
+    for path, key in ((PPTXEXTRACT_PATH, PPTXEXTRACT_KEY), (CVNORMALIZE_PATH, CVNORMALIZE_KEY),
+                      (RENDER_PATH, RENDER_KEY))
+    if BASE_URL or path.startswith("http")
+}
+
+def build_url(req: func.HttpRequest, path: str, key: str = "") -> str:
+    url = _URLS.get((path, key))
+    if url is None:
+        # Relative path with no DOWNSTREAM_BASE_URL: same host as this request
+        root = req.url.split("/api/")[0]
+        url = with_key(f"{root}{path}", key)
+    return url
+
+def post_json(url: str, payload: dict, timeout: int = HTTP_TIMEOUT_SEC, compress: bool = False):
+    """(status, parsed JSON or None, raw). raw is the body bytes only for a 200 JSON object (relayable as-is);
+    otherwise it is decoded text, safe to put in error messages."""
+    try:
+        body = orjson.dumps(payload)
+        if compress:
+            # Level 1: HTML shrinks several-fold at negligible CPU on the request path
+            r = SESSION.post(url, data=gzip.compress(body, compresslevel=1), headers=_GZIP_JSON_HEADERS, timeout=timeout)
+        else:
+            r = SESSION.post(url, data=body, headers=_JSON_HEADERS, timeout=timeout)
+        content = r.content
+        try:
+            j = orjson.loads(content) if content else None
+        except Exception:
+            j = None
+        raw = content if r.status_code == 200 and isinstance(j, dict) else content.decode("utf-8", "replace")
+        return r.status_code, j, raw
+    except Exception as e:
+        return 0, None, f"Network error calling {url}: {e}"
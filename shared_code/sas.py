@@ -0,0 +1,34 @@
+# shared_code/sas.py — per-worker cache of signed blob URLs (chatcv, renderpdf_html)
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+class SasUrlCache:
+    """(container, blob) -> (signed url, expiry); LRU-bounded, reused while >25% of the lifetime remains."""
+
+    def __init__(self, maxsize: int = 256):
+        self._d: "OrderedDict[Tuple[str, str], Tuple[str, datetime]]" = OrderedDict()
+        self._max = maxsize
+        self._lock = threading.Lock()  # callers run on thread pools, so updates can race
+
+    def get(self, container: str, blob_name: str, minutes: int) -> Optional[str]:
+        key = (container, blob_name)
+        with self._lock:
+            hit = self._d.get(key)
+            if hit and (hit[1] - datetime.now(timezone.utc)).total_seconds() > minutes * 60 * 0.25:
+                self._d.move_to_end(key)
+                return hit[0]
+        return None
+
+    def put(self, container: str, blob_name: str, url: str, expiry: datetime) -> None:
+        key = (container, blob_name)
+        with self._lock:
+            self._d[key] = (url, expiry)
+            self._d.move_to_end(key)
+            if len(self._d) > self._max:
+                self._d.popitem(last=False)
+
+    def discard(self, container: str, blob_name: str) -> None:
+        with self._lock:
+            self._d.pop((container, blob_name), None)
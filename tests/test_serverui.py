@@ -0,0 +1,68 @@
+import builtins
+import importlib.util
+import os
+
+import pytest
+
+func = pytest.importorskip("azure.functions")
+
+SERVERUI = os.path.join(os.path.dirname(__file__), "..", "serverui", "init.py")
+
+
+@pytest.fixture
+def serverui(tmp_path):
+    spec = importlib.util.spec_from_file_location("serverui_under_test", SERVERUI)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    (tmp_path / "index.html").write_bytes(b"<html>index</html>")
+    (tmp_path / "chatcv.html").write_bytes(b"<html>chat</html>")
+    mod.BASE_DIR = str(tmp_path)
+    return mod
+
+
+def _get(mod, path):
+    req = func.HttpRequest(method="GET", url=f"http://localhost/ui/{path}", route_params={"path": path}, body=b"")
+    return mod.main(req)
+
+
+def _no_filesystem(monkeypatch):
+    def boom(*args, **kwargs):
+        raise AssertionError("filesystem touched on a cached path")
+    monkeypatch.setattr(os.path, "isfile", boom)
+    monkeypatch.setattr(builtins, "open", boom)
+
+
+@pytest.mark.parametrize("path, body", [
+    ("chatcv.html", b"<html>chat</html>"),  # real file
+    ("app/chat", b"<html>index</html>"),    # SPA route served from index.html
+    ("", b"<html>index</html>"),
+])
+def test_second_get_is_served_from_memory(serverui, monkeypatch, path, body):
+    first = _get(serverui, path)
+    assert first.status_code == 200 and first.get_body() == body
+
+    _no_filesystem(monkeypatch)
+    second = _get(serverui, path)
+    assert second.status_code == 200 and second.get_body() == body
+    assert second.mimetype == "text/html"
+
+
+def test_new_spa_route_reuses_cached_index(serverui, monkeypatch):
+    assert _get(serverui, "index.html").status_code == 200
+    _get(serverui, "app/chat")
+    monkeypatch.setattr(builtins, "open", lambda *a, **k: pytest.fail("index.html read twice"))
+    assert _get(serverui, "app/settings").get_body() == b"<html>index</html>"
+
+
+def test_spa_aliases_are_capped(serverui):
+    serverui._SPA_ALIASES_MAX = 2
+    for i in range(5):
+        assert _get(serverui, f"route{i}").status_code == 200
+    assert serverui._spa_aliases == 2
+    assert len(serverui._FILE_CACHE) == 3  # index.html + two aliases
+
+
+def test_missing_and_traversal_are_not_cached(serverui):
+    assert _get(serverui, "missing.js").status_code == 404
+    assert _get(serverui, "../secret.txt").status_code == 403
+    assert serverui._FILE_CACHE == {}